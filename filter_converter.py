@@ -1,104 +1,143 @@
+import functools
+import logging
+import mmap
+import os
 import re
+import stat
 import sys
-from typing import List, Dict, Tuple
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Dict, Optional, Tuple
+
+_log = logging.getLogger(__name__)
+
+# Files larger than this are mapped into memory instead of read()
+_MMAP_THRESHOLD = 64 * 1024
+
+# Precompiled patterns, reused for every filter
+_CONDITION_RE = re.compile(r'\(([^,]+),\s*([^,]+),\s*(.+?)\)')
+_INBOX_RE = re.compile(r'inbox/(.+)$')
+# Thunderbird folder path to Sieve folder name: '.' -> '-', '/' -> '.'
+_FOLDER_TRANS = str.maketrans({'.': '-', '/': '.'})
+
+# Template for a convertible rule with at least one action
+_RULE_TMPL = "# rule:[{name}]\nif {op} (\n    {conds}\n)\n{{\n{acts}\n}}"
+
+# Sieve test list operator for a leading Thunderbird keyword
+_OP_MAP = {'OR': 'anyof', 'AND': 'allof'}
+
+# Sieve tests per Thunderbird operation, for the headers Sieve knows by name
+_SIMPLE_HEADERS = ("from", "to", "cc", "subject")
+_OP_FMT = {
+    'is': 'header :is "{h}" "{v}"',
+    'contains': 'header :contains "{h}" "{v}"',
+    'begins with': 'header :matches "{h}" "{v}*"',
+    'ends with': 'header :contains "{h}" "*{v}"',
+}
+_OP_HEADER_FMT = {
+    (operation, header): fmt.replace('{h}', header.capitalize())
+    for operation, fmt in _OP_FMT.items()
+    for header in _SIMPLE_HEADERS
+}
+# Fallback for any other header, which is passed through as-is
+_OP_GENERIC_FMT = {
+    'contains': 'header :contains {h} "{v}"',
+}
 
 def read_thunderbird_filters(file_path: str) -> str:
     """Read the contents of a Thunderbird filter file."""
     try:
-        with open(file_path, 'r', encoding='utf-8') as file:
-            return file.read()
+        with open(file_path, 'rb') as file:
+            if os.fstat(file.fileno()).st_size > _MMAP_THRESHOLD:
+                with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    return str(mapped, 'utf-8')
+            return file.read().decode('utf-8')
     except FileNotFoundError:
         raise FileNotFoundError(f"Error: File '{file_path}' not found.")
     except IOError as e:
         raise IOError(f"Error reading file '{file_path}': {e}")
 
-def parse_thunderbird_filters(thunderbird_filters: str) -> List[Dict[str, str]]:
-    """Parse Thunderbird filters into a list of dictionaries."""
-    filters = []
+def _iter_lines(text: str) -> Iterator[str]:
+    """Yield the '\n'-separated lines of text one at a time, without copying the whole text."""
+    find = text.find
+    start = 0
+    end = find('\n')
+    while end != -1:
+        yield text[start:end]
+        start = end + 1
+        end = find('\n', start)
+    yield text[start:]
+
+def parse_thunderbird_filters(thunderbird_filters: str) -> Iterator[Dict[str, str]]:
+    """Parse Thunderbird filters, yielding one dictionary per filter."""
     current_filter = {}
-    for line in thunderbird_filters.split('\n'):
-        line = line.strip()
-        if not line:
+    for line in _iter_lines(thunderbird_filters):
+        key, sep, value = line.strip().partition('=')
+        if not sep:
             continue
-        if line.startswith('name='):
-            if current_filter and 'name' in current_filter and 'condition' in current_filter:
-                filters.append(current_filter)
-            current_filter = {}
-        if '=' in line:
-            key, value = line.split('=', 1)
-            value = value.strip('"')
-            if key == 'action':
-                if 'actions' not in current_filter:
-                    current_filter['actions'] = []
-                current_filter['actions'].append(value)
-            elif key == 'name':
-                current_filter['name'] = value
-            else:
-                current_filter[key] = value
+        value = value.strip('"')
+        if key == 'name':
+            if 'name' in current_filter and 'condition' in current_filter:
+                yield current_filter
+            current_filter = {'name': value}
+        elif key == 'action':
+            current_filter.setdefault('actions', []).append(value)
+        else:
+            current_filter[key] = value
 
-    # Check that the current filter has a name and condition before appending
-    if current_filter and 'name' in current_filter and 'condition' in current_filter:
-        filters.append(current_filter)
-        
-    return filters
+    # Check that the current filter has a name and condition before yielding
+    if 'name' in current_filter and 'condition' in current_filter:
+        yield current_filter
 
 
 def clean_header(header: str) -> str:
     """Remove unnecessary escaping from the header."""
     # Only unescape inner quotes if they are double-escaped
-    return header.replace('\\"', '"').strip('"')
+    if '\\"' in header:
+        header = header.replace('\\"', '"')
+    if header[:1] == '"' or header[-1:] == '"':
+        return header.strip('"')
+    return header
 
-def convert_condition(_condition: str) -> Tuple[str, List[str]]:
+@functools.lru_cache(maxsize=512)
+def convert_condition(_condition: str) -> Tuple[str, Tuple[str, ...]]:
     """Convert a Thunderbird condition to Sieve format."""
 
     condition = _condition.strip()
-    if condition.startswith('OR '):
-        operator = 'anyof'
-        condition = condition[3:]
-    elif condition.startswith('AND '):
-        operator = 'allof'
-        condition = condition[4:]
-    else:
-        operator = 'anyof'
+    head, sep, rest = condition.partition(' ')
+    operator = _OP_MAP.get(head, 'anyof') if sep else 'anyof'
+    if sep and head in _OP_MAP:
+        condition = rest
 
     # Regex to match the parts, including escaped quotes
-    parts = re.findall(r'\(([^,]+),\s*([^,]+),\s*(.+?)\)', condition)
+    parts = _CONDITION_RE.findall(condition)
 
     sieve_conditions = []
     for header, operation, value in parts:
         # Clean header and value
-        header = clean_header(header)
+        header = sys.intern(clean_header(header))
+        operation = sys.intern(operation)
         value = clean_header(value)
 
-        simple_headers =["from","to","cc","subject"]
-        print(f"    ℹ️️ header operation value: h'{header}' o'{operation}' v'{value}'")
-        if operation == 'is':
-            if header in simple_headers:
-                sieve_conditions.append(f'header :is "{header.capitalize()}" "{value}"')
-        elif operation =='contains':
-            if header in simple_headers:
-                sieve_conditions.append(f'header :contains "{header.capitalize()}" "{value}"')
+        _log.debug("header operation value: h'%s' o'%s' v'%s'", header, operation, value)
+        fmt = _OP_HEADER_FMT.get((operation, header))
+        if fmt:
+            sieve_conditions.append(fmt.format(v=value))
+        elif operation in _OP_GENERIC_FMT:
+            if ' or ' in header:
+                or_args = header.split(' or ')
+                capitalized = [w.capitalize() for w in or_args]
+                header_list = '["' + '","'.join(capitalized)+'"]'
             else:
-                if ' or ' in header:
-                    or_args = header.split(' or ')
-                    capitalized = [w.capitalize() for w in or_args]
-                    header_list = '["' + '","'.join(capitalized)+'"]'
-                    sieve_conditions.append(f'header :contains {header_list} "{value}"')
-                else:
-                    sieve_conditions.append(f'header :contains "{header}" "{value}"')
-        elif operation =='begins with':
-            if header in simple_headers:
-                sieve_conditions.append(f'header :matches "{header.capitalize()}" "{value}*"')
-        elif operation =='ends with':
-            if header in simple_headers:
-                sieve_conditions.append(f'header :contains "{header.capitalize()}" "*{value}"')
-        else:
-            print(f"    ☢️ unhandled header/operation: h'{header}' o'{operation}'")
+                header_list = f'"{header}"'
+            sieve_conditions.append(_OP_GENERIC_FMT[operation].format(h=header_list, v=value))
+        elif operation not in _OP_FMT:
+            _log.debug("unhandled header/operation: h'%s' o'%s'", header, operation)
 
     if len(sieve_conditions) == 0:
-        print(f"☢️ unhandled condition: {_condition}")
+        _log.warning("☢️ unhandled condition: %s", _condition)
 
-    return operator, sieve_conditions
+    return operator, tuple(sieve_conditions)
 
 
 def convert_to_sieve(thunderbird_filter: Dict[str, str]) -> str:
@@ -112,18 +151,19 @@ def convert_to_sieve(thunderbird_filter: Dict[str, str]) -> str:
     thunder_value = thunderbird_filter['actionValue'] if 'actionValue' in thunderbird_filter else None
 
     if 'actions' in thunderbird_filter:
-        if "Mark read" in thunder_actions:
+        action_set = frozenset(thunder_actions)
+        if "Mark read" in action_set:
             actions.append('\tsetflag "\\\\Seen";')
-        if "Mark flagged" in thunder_actions:
+        if "Mark flagged" in action_set:
             actions.append('\tsetflag "\\\\Flagged";')
-        if "Stop execution" in thunder_actions:
+        if "Stop execution" in action_set:
             actions.append('\tstop;')
-        if "Move to folder" in thunder_actions:
+        if "Move to folder" in action_set:
             full_path = thunder_value
-            folder_match = re.search(r'inbox/(.+)$', full_path.lower())
+            folder_match = _INBOX_RE.search(full_path.lower())
             if folder_match:
                 folder = folder_match.group(1)
-                actions.append(f'\tfileinto "INBOX.{folder.replace('.','-').replace('/','.')}";')
+                actions.append(f'\tfileinto "INBOX.{folder.translate(_FOLDER_TRANS)}";')
             elif '/Trash/' in full_path:
                 hint = f"rule deactivated because target is Trash '{full_path}'"
 
@@ -132,38 +172,158 @@ def convert_to_sieve(thunderbird_filter: Dict[str, str]) -> str:
 
     if len(sieve_conditions) == 0 :
         print(f"⚠️ see rule '{name}' (unhandled condition)")
-        sieve_rule = f"# WARNING: condition not convertable\n"
-        sieve_rule += f"# {condition}\n"
-        sieve_rule += f"# rule:[{name}]\n"
-
-        sieve_rule += f"#if {operator} (\n#    "
-        sieve_rule += "#,\n#    ".join(sieve_conditions)
-        sieve_rule += "\n#)\n#{\n#" + "\n#".join(actions) + "\n#}"
-    elif len(actions)==0:
+        parts = ["# WARNING: condition not convertable\n"]
+        parts.append(f"# {condition}\n")
+        parts.append(f"# rule:[{name}]\n")
+
+        parts.append(f"#if {operator} (\n#    ")
+        parts.append("#,\n#    ".join(sieve_conditions))
+        parts.append("\n#)\n#{\n#")
+        parts.append("\n#".join(actions))
+        parts.append("\n#}")
+        return "".join(parts)
+
+    if len(actions)==0:
         print(f"⚠️ see rule '{name}' (missing action)")
-        sieve_rule = f"# WARNING: rule has no action\n"
-        sieve_rule += f"# rule:[{name}]\n"
+        parts = ["# WARNING: rule has no action\n"]
+        parts.append(f"# rule:[{name}]\n")
         if hint:
-            sieve_rule += f"# hint {hint}\n"
-        sieve_rule += f"# conditions {condition}\n"
-        sieve_rule += f"# actions {thunder_actions}\n"
-        sieve_rule += f"# values {thunder_value}\n"
-    else:
-        sieve_rule = f"# rule:[{name}]\n"
-        sieve_rule += f"if {operator} (\n    "
-        sieve_rule += ",\n    ".join(sieve_conditions)
-        sieve_rule += "\n)\n{\n" + "\n".join(actions) + "\n}"
-
-    return sieve_rule
-
-def thunderbird_to_sieve(thunderbird_filters: str) -> str:
-    """Convert Thunderbird filters to Sieve rules."""
-    filters = parse_thunderbird_filters(thunderbird_filters)
-    sieve_rules = []
-    for filter in filters:
-        rule = convert_to_sieve(filter)
-        sieve_rules.append(rule)
-    return 'require ["fileinto", "imap4flags"];\n\n' + "\n\n".join(sieve_rules)
+            parts.append(f"# hint {hint}\n")
+        parts.append(f"# conditions {condition}\n")
+        parts.append(f"# actions {thunder_actions}\n")
+        parts.append(f"# values {thunder_value}\n")
+        return "".join(parts)
+
+    return _RULE_TMPL.format(name=name, op=operator,
+                             conds=",\n    ".join(sieve_conditions),
+                             acts="\n".join(actions))
+
+def iter_sieve_rules(thunderbird_filters: str, counter: Optional[List[int]] = None) -> Iterator[str]:
+    """Convert Thunderbird filters to Sieve rules, yielding the script piece by piece.
+
+    If given, counter[0] is incremented for every rule yielded.
+    """
+    yield 'require ["fileinto", "imap4flags"];\n\n'
+    separator = ""
+    for filter in parse_thunderbird_filters(thunderbird_filters):
+        yield separator
+        yield convert_to_sieve(filter)
+        separator = "\n\n"
+        if counter is not None:
+            counter[0] += 1
+
+def _copy_file_attributes(source: str, target: str) -> None:
+    """Give target the mode and owner of source, or the default mode for a new file."""
+    try:
+        st = os.stat(source)
+    except FileNotFoundError:
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(target, 0o666 & ~umask)
+        return
+    os.chmod(target, stat.S_IMODE(st.st_mode))
+    if hasattr(os, 'chown'):
+        try:
+            os.chown(target, st.st_uid, st.st_gid)
+        except PermissionError:
+            pass
+
+def write_sieve_rules(thunderbird_filters: str, output_file_path: str) -> int:
+    """Write the Sieve script for the filters to a file, returning the number of rules.
+
+    Regular files are written via a temporary file next to the (symlink
+    resolved) target, which only replaces the target once conversion has
+    succeeded. Anything else, e.g. /dev/stdout, is written directly.
+    """
+    rule_count = [0]
+    if os.path.exists(output_file_path) and not os.path.isfile(output_file_path):
+        with open(output_file_path, 'w', encoding='utf-8') as f:
+            f.writelines(iter_sieve_rules(thunderbird_filters, rule_count))
+        return rule_count[0]
+
+    target_path = os.path.realpath(output_file_path)
+    fd, temp_file_path = tempfile.mkstemp(dir=os.path.dirname(target_path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.writelines(iter_sieve_rules(thunderbird_filters, rule_count))
+        _copy_file_attributes(target_path, temp_file_path)
+        os.replace(temp_file_path, target_path)
+    except BaseException:
+        if os.path.exists(temp_file_path):
+            os.remove(temp_file_path)
+        raise
+    return rule_count[0]
+
+def thunderbird_to_sieve(thunderbird_filters: str, counter: Optional[List[int]] = None) -> str:
+    """Convert Thunderbird filters to Sieve rules.
+
+    If given, counter[0] is incremented for every rule converted.
+    """
+    return "".join(iter_sieve_rules(thunderbird_filters, counter))
+
+def _convert_one(file_path: str, output_file_path: str) -> Tuple[str, int]:
+    """Convert one Thunderbird filter file, returning the output path and rule count."""
+    thunderbird_filters = read_thunderbird_filters(file_path)
+    return output_file_path, write_sieve_rules(thunderbird_filters, output_file_path)
+
+def _output_names(paths: List[str]) -> List[str]:
+    """Pick a distinct Sieve file name for every input path.
+
+    Inputs are named after their file name. Inputs whose names collide are
+    prefixed with as many of their parent directories (below the directory
+    all inputs share) as needed to tell them apart, e.g.
+    ImapMail/imap.example.com/msgFilterRules.dat becomes
+    imap.example.com-msgFilterRules.sieve.
+    """
+    abs_paths = [os.path.abspath(path) for path in paths]
+    if len(set(abs_paths)) != len(abs_paths):
+        raise ValueError("Error: the same input file is given more than once.")
+
+    parent_dirs = [os.path.dirname(path) for path in abs_paths]
+    try:
+        common_dir = os.path.commonpath(parent_dirs) if parent_dirs else ''
+    except ValueError:
+        # Different drives on Windows share no directory
+        common_dir = ''
+    dirs = []
+    for parent_dir in parent_dirs:
+        relative_dir = os.path.relpath(parent_dir, common_dir) if common_dir else parent_dir
+        dirs.append([] if relative_dir == os.curdir else relative_dir.strip(os.sep).split(os.sep))
+    file_names = [os.path.splitext(os.path.basename(path))[0] for path in abs_paths]
+    depths = [0] * len(abs_paths)
+
+    while True:
+        names = ['-'.join(dirs[i][len(dirs[i]) - depths[i]:] + [file_names[i]])
+                 for i in range(len(abs_paths))]
+        colliding = [i for i, name in enumerate(names) if names.count(name) > 1]
+        if not colliding:
+            return [name + '.sieve' for name in names]
+        widened = False
+        for i in colliding:
+            if depths[i] < len(dirs[i]):
+                depths[i] += 1
+                widened = True
+        if not widened:
+            # Same directories, so only the extension can tell them apart
+            for i in colliding:
+                full_name = os.path.basename(abs_paths[i])
+                if file_names[i] != full_name:
+                    file_names[i] = full_name
+                    widened = True
+        if not widened:
+            raise ValueError("Error: cannot derive distinct output file names for the input files.")
+
+def convert_files(paths: List[str], out_dir: str, workers: Optional[int] = None) -> List[Tuple[str, int]]:
+    """Convert several Thunderbird filter files in parallel worker processes.
+
+    Each input is written to out_dir, which is created if needed, under the
+    name chosen by _output_names. Returns the output path and rule count of
+    every file, in input order.
+    """
+    output_file_paths = [os.path.join(out_dir, name) for name in _output_names(paths)]
+    os.makedirs(out_dir, exist_ok=True)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(_convert_one, paths, output_file_paths))
 
 def main():
     """Main function to handle command-line arguments and file operations."""
@@ -176,13 +336,10 @@ def main():
 
     try:
         thunderbird_filters = read_thunderbird_filters(input_file_path)
-        sieve_rules = thunderbird_to_sieve(thunderbird_filters)
-
-        with open(output_file_path, 'w', encoding='utf-8') as f:
-            f.write(sieve_rules)
+        rule_count = write_sieve_rules(thunderbird_filters, output_file_path)
 
         print(f"Sieve rules have been successfully written to {output_file_path}")
-        print(f"Total rules converted: {sieve_rules.count('# rule:')}")
+        print(f"Total rules converted: {rule_count}")
     except Exception as e:
         print(f"An error occurred: {e}")
         sys.exit(1)
@@ -0,0 +1,52 @@
+import os
+import tempfile
+import unittest
+
+from filter_converter import _output_names, convert_files
+
+
+class OutputNamesTest(unittest.TestCase):
+    def test_unique_file_names_are_kept(self):
+        self.assertEqual(_output_names(["a/x.dat", "b/y.dat"]), ["x.sieve", "y.sieve"])
+
+    def test_only_colliding_names_get_parent_directories(self):
+        self.assertEqual(_output_names(["a/x.dat", "a/y.dat", "b/x.dat"]),
+                         ["a-x.sieve", "y.sieve", "b-x.sieve"])
+
+    def test_thunderbird_accounts(self):
+        paths = ["profile/ImapMail/imap.example.com/msgFilterRules.dat",
+                 "profile/ImapMail/imap.example.org/msgFilterRules.dat"]
+        self.assertEqual(_output_names(paths),
+                         ["imap.example.com-msgFilterRules.sieve",
+                          "imap.example.org-msgFilterRules.sieve"])
+
+    def test_directories_above_the_inputs_are_not_used(self):
+        self.assertEqual(_output_names(["one/x.dat", "two/one/x.dat"]),
+                         ["one-x.sieve", "two-one-x.sieve"])
+
+    def test_extension_separates_files_in_the_same_directory(self):
+        self.assertEqual(_output_names(["a/x.dat", "a/x.txt"]), ["x.dat.sieve", "x.txt.sieve"])
+
+    def test_same_file_twice_is_rejected(self):
+        with self.assertRaises(ValueError):
+            _output_names(["a/x.dat", "a/./x.dat"])
+
+
+class ConvertFilesTest(unittest.TestCase):
+    def test_creates_missing_output_directory(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            input_path = os.path.join(tmp, "msgFilterRules.dat")
+            with open(input_path, "w", encoding="utf-8") as f:
+                f.write('name="Friends"\naction="Mark read"\ncondition="OR (from,is,bob@example.com)"\n')
+            out_dir = os.path.join(tmp, "sieve")
+
+            result = convert_files([input_path], out_dir, workers=1)
+
+            output_path = os.path.join(out_dir, "msgFilterRules.sieve")
+            self.assertEqual(result, [(output_path, 1)])
+            with open(output_path, encoding="utf-8") as f:
+                self.assertIn('header :is "From" "bob@example.com"', f.read())
+
+
+if __name__ == "__main__":
+    unittest.main()